@@ -0,0 +1,11 @@
+# Configuração do Gunicorn para produção.
+# Cada worker é um processo com seu próprio event loop do Uvicorn, de modo que
+# um trecho que ocupe a CPU (ex: processar PDFs) não trava o atendimento dos demais.
+import multiprocessing
+import os
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Por padrão, 2 workers por CPU; pode ser ajustado com a variável WEB_CONCURRENCY.
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
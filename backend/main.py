@@ -1,39 +1,82 @@
 # Importações necessárias do FastAPI e outras bibliotecas
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict
 import os
+import asyncio
+import hashlib
 import logging
+import json
+import pickle
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from filelock import FileLock
+import numpy as np
+import faiss
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
 
 # --- Novas importações para RAG e OpenAI ---
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores import Chroma, FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+from langchain_core.embeddings import Embeddings
+import chromadb
 
-# Importações específicas da OpenAI
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+# Fábrica dos modelos (embeddings e LLM) da OpenAI
+from providers import (
+    EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, LLM_MODEL,
+    get_embeddings, get_llm, create_async_http_client, close_http_clients,
+)
 # --- Fim das novas importações ---
 
-# Configura o logger para exibir mensagens no console
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configura o logger para exibir mensagens no console.
+# As mensagens entram em uma fila e são gravadas por uma thread separada
+# (QueueListener), para que a escrita no console não atrase as requisições.
+# O nível pode ser ajustado pela variável LOG_LEVEL (ex: WARNING em produção).
+log_queue = queue.SimpleQueue()
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, console_handler)
+# O QueueHandler só monta a mensagem; data e nível são acrescentados uma única
+# vez pelo console_handler na thread do listener.
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[queue_handler])
+log_listener.start()
+
+# --- Sondagens de liveness/readiness (/healthz e /readyz) ---
+# São chamadas a cada poucos segundos pelo orquestrador, por isso ficam fora
+# do log de acesso do Uvicorn.
+PROBE_PATHS = ("/healthz", "/readyz")
+
+class ProbeAccessLogFilter(logging.Filter):
+    """Descarta do log de acesso as requisições às rotas de sondagem."""
 
-# Carrega as variáveis de ambiente do arquivo .env
-load_dotenv()
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Argumentos do log de acesso: (cliente, método, caminho, versão HTTP, status)
+        if isinstance(record.args, tuple) and len(record.args) >= 3:
+            return str(record.args[2]).split("?", 1)[0] not in PROBE_PATHS
+        return True
 
-# Carrega e verifica a OPENAI_API_KEY
-openai_api_key_env = os.getenv("OPENAI_API_KEY")
-if not openai_api_key_env:
-    logging.error("OPENAI_API_KEY não encontrada nas variáveis de ambiente.")
-    raise ValueError("OPENAI_API_KEY não encontrada. Por favor, configure-a no arquivo .env.")
+logging.getLogger("uvicorn.access").addFilter(ProbeAccessLogFilter())
+# --- Fim das sondagens ---
 
 # Inicializa o aplicativo FastAPI
 app = FastAPI()
 
+# Tamanho do pool de threads padrão do event loop de cada worker
+THREADPOOL_SIZE = 16
+
 # --- Configuração do CORS para permitir requisições do frontend ---
 # Para o desenvolvimento local, permitir todas as origens é uma prática comum.
 # Em produção, você deve substituir "*" pela URL do seu frontend.
@@ -48,56 +91,437 @@ app.add_middleware(
 )
 # --- Fim da configuração do CORS ---
 
+# --- Configuração do vetor store persistente ---
+# O Chroma é gravado em disco para que os embeddings sobrevivam a reinicializações.
+# Cada PDF é identificado por um hash de (caminho, mtime, parâmetros de divisão e
+# modelo de embeddings); só os arquivos novos ou alterados são reprocessados.
+CHROMA_PERSIST_DIR = "./chroma_db"
+CHROMA_COLLECTION = "farmacia_docs"
+CHROMA_LOCK_FILE = f"{CHROMA_PERSIST_DIR}.lock"
+# Hashes dos PDFs sem texto extraível (ex: digitalizados), que não geram
+# chunks e, portanto, não deixam nenhum registro no Chroma
+EMPTY_DOCS_FILE = os.path.join(CHROMA_PERSIST_DIR, "empty_documents.json")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Diretório onde os chunks de cada PDF ficam gravados, indexados pelo conteúdo
+SPLITS_CACHE_DIR = "./cache"
+# Abaixo deste número de chunks a busca é feita em um índice FAISS exato
+# (força bruta), mais rápido de montar e consultar que o HNSW do Chroma.
+FAISS_MAX_CHUNKS = 5000
+# Quantidade de lotes de embeddings enviados em paralelo durante a indexação
+EMBEDDING_CONCURRENCY = 8
+# Parâmetros da busca MMR: k chunks vão para o prompt, escolhidos entre
+# os fetch_k mais próximos da pergunta
+RETRIEVER_SEARCH_KWARGS = {"k": 3, "fetch_k": 12, "lambda_mult": 0.5}
+# --- Fim da configuração do vetor store ---
+
+# --- Configuração do cache de respostas ---
+RESPONSE_CACHE_SIZE = 2048
+# Similaridade de cosseno mínima para considerar duas perguntas equivalentes.
+# Um acerto semântico devolve a resposta de OUTRA pergunta sem consultar os
+# documentos nem o LLM; perguntas curtas que diferem em uma palavra-chave
+# ("horário de sábado" x "horário de domingo") podem ter cosseno muito alto.
+# Por isso o padrão é conservador e depende do modelo: o ada-002 concentra as
+# similaridades entre ~0.7 e 1.0 e exige um limiar mais rígido.
+# Ajustável por SEMANTIC_CACHE_THRESHOLD; um valor >= 1 desativa o nível
+# semântico e mantém só o cache de perguntas idênticas.
+SEMANTIC_CACHE_DEFAULT_THRESHOLDS = {
+    "text-embedding-ada-002": 0.995,
+    "text-embedding-3-small": 0.98,
+    "text-embedding-3-large": 0.98,
+}
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv(
+    "SEMANTIC_CACHE_THRESHOLD",
+    SEMANTIC_CACHE_DEFAULT_THRESHOLDS.get(EMBEDDING_MODEL, 0.995),
+))
+# --- Fim da configuração do cache ---
+
 # --- Variáveis globais para RAG ---
 # Estas variáveis serão inicializadas na startup da aplicação
+embeddings = None
 vectorstore = None
 retriever = None
 llm = None
 chain = None
+# Indica se o carregamento dos documentos (executado em segundo plano) terminou
+ready = False
 # --- Fim das variáveis globais ---
 
+# Normalização L2 dos embeddings, separada por formato para evitar
+# verificações de dimensão no caminho de cada pergunta
+def normalize_1d(vector: np.ndarray) -> np.ndarray:
+    norm = np.sqrt(np.dot(vector, vector))
+    return vector / norm if norm > 0 else vector
+
+def normalize_2d(matrix: np.ndarray) -> np.ndarray:
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    norms[norms == 0] = 1.0
+    return matrix / norms[:, None]
+
+# Embeddings que memorizam os vetores das perguntas mais recentes
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Repassa as chamadas para o modelo de embeddings, guardando os vetores
+    (já normalizados) das últimas perguntas. O cache de respostas e o
+    retriever embutem a mesma pergunta, mas só a primeira chamada vai até a API.
+    É chamado tanto do event loop quanto de threads do executor (buscas
+    assíncronas do LangChain que caem no embed_query síncrono), por isso o
+    acesso ao dicionário é protegido por um lock.
+    """
+
+    def __init__(self, embeddings: Embeddings, maxsize: int = 256):
+        self.embeddings = embeddings
+        self.maxsize = maxsize
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._recall(text)
+        if vector is None:
+            vector = self._remember(text, self.embeddings.embed_query(text))
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._recall(text)
+        if vector is None:
+            vector = self._remember(text, await self.embeddings.aembed_query(text))
+        return vector
+
+    def _recall(self, text: str):
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+            return vector
+
+    def _remember(self, text: str, vector: List[float]) -> List[float]:
+        vector = normalize_1d(np.asarray(vector, dtype=np.float32)).tolist()
+        with self._lock:
+            self._queries[text] = vector
+            if len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+        return vector
+
+# Cache das respostas geradas pela cadeia RAG
+class ResponseCache:
+    """
+    Guarda as respostas do chatbot em dois níveis: um LRU para perguntas
+    idênticas (ignorando maiúsculas e espaços) e uma busca por similaridade
+    de cosseno sobre os embeddings das perguntas para as quase idênticas.
+    """
+
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._exact = OrderedDict()
+        # Buffer circular com os embeddings das perguntas já respondidas
+        self._vectors = None
+        self._norms = np.zeros(maxsize, dtype=np.float32)
+        self._answers = [None] * maxsize
+        self._count = 0
+        self._next = 0
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        return " ".join(message.lower().split())
+
+    def get_exact(self, message: str):
+        key = self.normalize(message)
+        answer = self._exact.get(key)
+        if answer is not None:
+            self._exact.move_to_end(key)
+        return answer
+
+    def get_similar(self, query_vector: List[float]):
+        if not self._count or self.threshold >= 1:
+            return None
+        q = np.asarray(query_vector, dtype=np.float32)
+        q_norm = np.linalg.norm(q)
+        if not q_norm:
+            return None
+        sims = self._vectors[:self._count] @ q / (self._norms[:self._count] * q_norm)
+        best = int(sims.argmax())
+        if sims[best] > self.threshold:
+            return self._answers[best]
+        return None
+
+    def put(self, message: str, query_vector: List[float], answer: str):
+        key = self.normalize(message)
+        self._exact[key] = answer
+        self._exact.move_to_end(key)
+        if len(self._exact) > self.maxsize:
+            self._exact.popitem(last=False)
+
+        q = np.asarray(query_vector, dtype=np.float32)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.maxsize, q.shape[0]), dtype=np.float32)
+        self._vectors[self._next] = q
+        self._norms[self._next] = np.linalg.norm(q)
+        self._answers[self._next] = answer
+        self._next = (self._next + 1) % self.maxsize
+        self._count = min(self._count + 1, self.maxsize)
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+
+# Calcula o identificador de um PDF dentro do vetor store
+def compute_document_hash(file_path: str) -> str:
+    """
+    Gera um hash que muda sempre que o arquivo, a forma de dividi-lo
+    ou o modelo de embeddings mudarem.
+    """
+    key = f"{file_path}:{os.path.getmtime(file_path)}:{CHUNK_SIZE}:{CHUNK_OVERLAP}:{EMBEDDING_MODEL}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+# Divide as páginas de um PDF, reaproveitando o resultado gravado em disco
+def split_documents_cached(text_splitter, documents, file_path: str):
+    """
+    Divide os documentos em chunks. O resultado é gravado em SPLITS_CACHE_DIR
+    sob um hash BLAKE2 do conteúdo das páginas, de modo que um PDF com o mesmo
+    texto não precisa ser dividido novamente. Cada PDF mantém só o arquivo da
+    sua versão mais recente; os anteriores são apagados ao gravar um novo.
+    Um arquivo de cache ilegível (gravação interrompida ou versão incompatível
+    do LangChain) é ignorado e o PDF é dividido de novo.
+    """
+    path_hash = hashlib.blake2b(file_path.encode(), digest_size=8).hexdigest()
+    content_hash = hashlib.blake2b(f"{file_path}:{CHUNK_SIZE}:{CHUNK_OVERLAP}".encode())
+    for document in documents:
+        content_hash.update(b"\0" + document.page_content.encode())
+    cache_name = f"splits_{path_hash}_{content_hash.hexdigest()}.pkl"
+    cache_path = os.path.join(SPLITS_CACHE_DIR, cache_name)
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                splits = pickle.load(f)
+            logging.info(f"Chunks de {file_path} lidos do cache em disco.")
+            return splits
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            logging.warning(f"Cache de chunks ilegível para {file_path}, dividindo novamente: {e}")
+
+    splits = text_splitter.split_documents(documents)
+    os.makedirs(SPLITS_CACHE_DIR, exist_ok=True)
+    # Grava em um arquivo temporário e o move de uma vez, para que uma
+    # interrupção no meio da escrita nunca deixe um cache truncado
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(splits, f)
+    os.replace(tmp_path, cache_path)
+
+    with os.scandir(SPLITS_CACHE_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(f"splits_{path_hash}_") and entry.name != cache_name:
+                os.remove(entry.path)
+    return splits
+
+# Lê e grava a lista de PDFs já processados que não geraram chunks
+def load_empty_documents() -> set:
+    try:
+        with open(EMPTY_DOCS_FILE, encoding="utf-8") as f:
+            return set(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return set()
+
+def save_empty_documents(empty_hashes: set):
+    tmp_path = f"{EMPTY_DOCS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sorted(empty_hashes), f)
+    os.replace(tmp_path, EMPTY_DOCS_FILE)
+
+# Verifica se todos os chunks de um PDF chegaram ao Chroma
+def is_document_indexed(collection, doc_hash: str, empty_hashes: set) -> bool:
+    """
+    Cada chunk grava em "chunk_count" o total de chunks do seu PDF; o PDF só
+    está completo quando todos estão presentes. Uma indexação interrompida
+    (processo encerrado no meio dos lotes) deixa uma contagem menor.
+    PDFs que não geraram nenhum chunk são reconhecidos por empty_hashes.
+    """
+    if doc_hash in empty_hashes:
+        return True
+    stored = collection.get(where={"doc_hash": doc_hash}, include=["metadatas"])
+    if not stored["ids"]:
+        return False
+    return len(stored["ids"]) == stored["metadatas"][0].get("chunk_count")
+
+# Gera os embeddings de vários chunks e os grava no Chroma
+async def index_splits(collection, splits):
+    """
+    Envia os textos para a API de embeddings em lotes de EMBEDDING_BATCH_SIZE
+    (uma requisição por lote, e não por chunk), com até EMBEDDING_CONCURRENCY
+    lotes em andamento ao mesmo tempo, e grava os vetores de cada lote no Chroma
+    assim que chegam.
+    Roda em um event loop próprio (via asyncio.run), por isso usa um cliente
+    HTTP assíncrono dedicado em vez do compartilhado com os endpoints.
+    """
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+    async with create_async_http_client() as http_async_client:
+        ingest_embeddings = get_embeddings(http_async_client=http_async_client)
+
+        async def embed_batch(batch):
+            texts = [split.page_content for split in batch]
+            async with semaphore:
+                vectors = await ingest_embeddings.aembed_documents(texts)
+            collection.add(
+                ids=[split.metadata["chunk_id"] for split in batch],
+                embeddings=vectors,
+                documents=texts,
+                metadatas=[split.metadata for split in batch],
+            )
+
+        await asyncio.gather(*(
+            embed_batch(splits[start:start + EMBEDDING_BATCH_SIZE])
+            for start in range(0, len(splits), EMBEDDING_BATCH_SIZE)
+        ))
+    logging.info(f"{len(splits)} novos chunks indexados no vetor store.")
+
+# Monta um índice FAISS em memória a partir dos vetores do Chroma
+def build_faiss_index(collection, embeddings):
+    """
+    Cria um índice FAISS de busca exata por produto interno sobre vetores
+    normalizados (ou seja, similaridade de cosseno) com os chunks e embeddings
+    já gravados no Chroma, sem nenhuma chamada à API de embeddings.
+    A matriz dos documentos é normalizada uma única vez aqui; os vetores das
+    perguntas chegam normalizados pelo CachedQueryEmbeddings.
+    Os vetores são armazenados em float16 (IndexScalarQuantizer), com metade da
+    memória lida a cada busca e perda de precisão desprezível para cosseno.
+    """
+    stored = collection.get(include=["embeddings", "documents", "metadatas"])
+    vectors = normalize_2d(np.asarray(stored["embeddings"], dtype=np.float32))
+
+    index = faiss.IndexScalarQuantizer(
+        vectors.shape[1], faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+    )
+    index.train(vectors)
+    index.add(vectors)
+
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=text, metadata=metadata or {})
+        for doc_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+    })
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(stored["ids"])),
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
 # Função para carregar, processar e armazenar documentos para RAG
 def load_and_process_documents(directory_path: str):
     """
     Carrega documentos de um diretório, divide-os, cria embeddings
-    e os armazena em um vetor store Chroma.
+    e os armazena em um vetor store Chroma persistido em disco.
+    PDFs já indexados e sem alterações não são reprocessados.
+    Corpora pequenos são consultados por um índice FAISS exato em memória.
     """
-    global vectorstore, retriever, llm, chain  # Declarar como global para modificar
+    global embeddings, vectorstore, retriever, llm, chain, ready  # Declarar como global para modificar
 
     logging.info(f"Iniciando carregamento e processamento de documentos do diretório: {directory_path}")
 
     try:
-        # 1. Carregar documentos (ex: PDFs)
-        documents = []
-        for filename in os.listdir(directory_path):
-            if filename.endswith(".pdf"):
-                file_path = os.path.join(directory_path, filename)
-                logging.info(f"Carregando PDF: {file_path}")
-                loader = PyPDFLoader(file_path)
-                documents.extend(loader.load())
-        
-        if not documents:
+        # 1. Abrir o vetor store persistente (criado vazio na primeira execução)
+        embeddings = CachedQueryEmbeddings(get_embeddings())
+        logging.info("Embeddings da OpenAI inicializados.")
+
+        # Apenas um processo (worker) por vez sincroniza o Chroma com os PDFs;
+        # os demais aguardam e encontram os documentos já indexados.
+        with FileLock(CHROMA_LOCK_FILE):
+            client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+            collection = client.get_or_create_collection(CHROMA_COLLECTION, embedding_function=None)
+            vectorstore = Chroma(
+                client=client,
+                collection_name=CHROMA_COLLECTION,
+                embedding_function=embeddings,
+            )
+            logging.info(f"Vector store Chroma aberto em {CHROMA_PERSIST_DIR} ({collection.count()} chunks).")
+
+            # 2. Identificar os PDFs do diretório e descartar chunks de arquivos
+            # removidos ou alterados desde a última execução
+            with os.scandir(directory_path) as entries:
+                pdf_paths = [entry.path for entry in entries if entry.is_file() and entry.name.endswith(".pdf")]
+            pdf_hashes = {file_path: compute_document_hash(file_path) for file_path in pdf_paths}
+
+            if pdf_hashes:
+                collection.delete(where={"doc_hash": {"$nin": list(pdf_hashes.values())}})
+            elif collection.count():
+                collection.delete(where={"doc_hash": {"$ne": ""}})
+
+            # Só interessam os PDFs vazios que ainda estão no diretório
+            stored_empty_hashes = load_empty_documents()
+            empty_hashes = stored_empty_hashes & set(pdf_hashes.values())
+
+            # 3. Carregar (em paralelo) e dividir apenas os PDFs que ainda não estão no vetor store
+            pending_files = []
+            for file_path, doc_hash in pdf_hashes.items():
+                if is_document_indexed(collection, doc_hash, empty_hashes):
+                    logging.info(f"PDF sem alterações, reutilizando embeddings: {file_path}")
+                else:
+                    logging.info(f"Carregando PDF: {file_path}")
+                    # Descarta chunks de uma indexação anterior que não terminou
+                    collection.delete(where={"doc_hash": doc_hash})
+                    pending_files.append(file_path)
+
+            loaded_pdfs = []
+            if pending_files:
+                max_workers = min(8, (os.cpu_count() or 1) * 2, len(pending_files))
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    loaded_pdfs = list(executor.map(lambda path: PyPDFLoader(path).load(), pending_files))
+
+            text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+            pending_splits = []
+            for file_path, documents in zip(pending_files, loaded_pdfs):
+                doc_hash = pdf_hashes[file_path]
+                splits = split_documents_cached(text_splitter, documents, file_path)
+                for i, split in enumerate(splits):
+                    split.metadata["doc_hash"] = doc_hash
+                    split.metadata["chunk_id"] = f"{doc_hash}-{i}"
+                    split.metadata["chunk_count"] = len(splits)
+                pending_splits.extend(splits)
+                logging.info(f"{file_path} dividido em {len(splits)} chunks.")
+                if not splits:
+                    logging.warning(f"{file_path} não tem texto extraível; será ignorado até ser alterado.")
+                    empty_hashes.add(doc_hash)
+
+            if empty_hashes != stored_empty_hashes:
+                save_empty_documents(empty_hashes)
+
+            # 4. Gerar os embeddings em lotes concorrentes e indexar os novos chunks
+            if pending_splits:
+                try:
+                    asyncio.run(index_splits(collection, pending_splits))
+                except Exception:
+                    # Limpa já os chunks parciais; a contagem de "chunk_count" cobre
+                    # os casos em que o processo é encerrado antes de chegar aqui
+                    collection.delete(where={"doc_hash": {"$in": [pdf_hashes[path] for path in pending_files]}})
+                    raise
+
+        if collection.count() == 0:
             logging.warning("Nenhum documento PDF encontrado para carregar. O RAG não será ativado.")
+            vectorstore = None
             return
 
-        # 2. Dividir documentos em chunks menores
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        splits = text_splitter.split_documents(documents)
-        logging.info(f"Documentos divididos em {len(splits)} chunks.")
-
-        # 3. Criar embeddings (usando OpenAIEmbeddings)
-        embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key_env)
-        logging.info("Embeddings da OpenAI inicializados.")
+        # 5. Escolher o índice de busca conforme o tamanho do corpus
+        chunk_count = collection.count()
+        if chunk_count < FAISS_MAX_CHUNKS:
+            vectorstore = build_faiss_index(collection, embeddings)
+            logging.info(f"Índice FAISS (float16) criado com {chunk_count} chunks.")
+        else:
+            logging.info(f"Usando o índice HNSW do Chroma para {chunk_count} chunks.")
 
-        # 4. Criar e persistir o vetor store Chroma
-        vectorstore = Chroma.from_documents(documents=splits, embedding=embeddings)
-        retriever = vectorstore.as_retriever()
-        logging.info("Vector store Chroma criado e retriever configurado.")
+        # MMR (Maximal Marginal Relevance) escolhe chunks relevantes e diferentes
+        # entre si: menos chunks redundantes chegam ao prompt do LLM.
+        retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs=RETRIEVER_SEARCH_KWARGS)
+        logging.info("Vector store pronto e retriever configurado.")
 
         # Inicializa o modelo LLM (usando ChatOpenAI)
-        # Você pode especificar outros modelos como "gpt-4" se tiver acesso
-        llm = ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=openai_api_key_env)
-        logging.info("Modelo OpenAI (gpt-3.5-turbo) inicializado para a cadeia RAG.")
+        llm = get_llm()
+        logging.info(f"Modelo OpenAI ({LLM_MODEL}) inicializado para a cadeia RAG.")
 
         # Define o prompt do sistema para o chatbot com contexto RAG
         system_prompt = (
@@ -118,9 +542,18 @@ def load_and_process_documents(directory_path: str):
             ]
         )
 
-        # Função auxiliar para combinar documentos
+        # Função auxiliar para combinar documentos.
+        # Remove apenas chunks com texto idêntico (o mesmo trecho presente em
+        # dois PDFs); o texto repetido entre chunks vizinhos pela sobreposição
+        # (chunk_overlap) não é tratado aqui.
         def combine_documents(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
+            seen = set()
+            contents = []
+            for doc in docs:
+                if doc.page_content not in seen:
+                    seen.add(doc.page_content)
+                    contents.append(doc.page_content)
+            return "\n\n".join(contents)
 
         # Monta a cadeia RAG
         chain = (
@@ -136,11 +569,15 @@ def load_and_process_documents(directory_path: str):
 
     except Exception as e:
         logging.error(f"Erro ao carregar e processar documentos para RAG: {e}")
+        embeddings = None
         vectorstore = None
         retriever = None
         llm = None
         chain = None
         logging.error("RAG não será funcional devido ao erro de carregamento de documentos.")
+    finally:
+        ready = True
+        logging.info("Processo de carregamento de documentos concluído.")
 
 
 # Rota para a raiz do aplicativo (apenas para verificar se está online)
@@ -149,35 +586,127 @@ async def root():
     logging.info("Requisição GET recebida na raiz.")
     return {"message": "Chatbot da Farmácia está online e aguardando mensagens!"}
 
+# Liveness: o processo está de pé e respondendo
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return PlainTextResponse("ok")
+
+# Readiness: os documentos foram carregados e a cadeia RAG está pronta
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if ready and chain is not None:
+        return PlainTextResponse("ok")
+    return PlainTextResponse("not-ready", status_code=503)
+
 # --- Endpoint para o frontend web ---
 class ChatRequest(BaseModel):
     user_message: str
 
+# Consulta o cache de respostas para uma mensagem do usuário
+async def lookup_cached_response(user_message: str):
+    """
+    Retorna a resposta em cache (ou None) e o embedding da pergunta, que deve
+    ser repassado ao response_cache.put quando a resposta for gerada.
+    """
+    cached_response = response_cache.get_exact(user_message)
+    if cached_response is not None:
+        return cached_response, None
+    query_vector = await embeddings.aembed_query(user_message)
+    return response_cache.get_similar(query_vector), query_vector
+
 @app.post("/api/chat")
 async def handle_chat_message(request: ChatRequest):
-    logging.info(f"Requisição de chat recebida: {request.user_message}")
+    logging.info(f"Requisição de chat recebida ({len(request.user_message)} caracteres).")
+    logging.debug("Mensagem do usuário: %s", request.user_message)
+
+    if not ready:
+        raise HTTPException(status_code=503, detail="O chatbot está aquecendo, tente novamente em instantes.")
 
     if not chain:
         logging.error("A cadeia RAG não foi inicializada.")
         return {"response": "Desculpe, o sistema de conhecimento está indisponível no momento."}
 
     try:
+        # Perguntas repetidas ou quase idênticas são respondidas pelo cache,
+        # sem passar pelo retriever nem pelo LLM.
+        cached_response, query_vector = await lookup_cached_response(request.user_message)
+        if cached_response is not None:
+            logging.info(f"Resposta obtida do cache para o chat ({len(cached_response)} caracteres).")
+            return {"response": cached_response}
+
         # A nova cadeia LangChain já trata a entrada de forma simples,
         # portanto, passamos a mensagem do usuário diretamente.
-        bot_response = chain.invoke(request.user_message)
-        logging.info(f"Resposta gerada pelo bot para o chat: {bot_response}")
+        # O ainvoke libera o event loop enquanto aguarda a OpenAI.
+        bot_response = await chain.ainvoke(request.user_message)
+        response_cache.put(request.user_message, query_vector, bot_response)
+        logging.info(f"Resposta gerada pelo bot para o chat ({len(bot_response)} caracteres).")
+        logging.debug("Resposta do bot: %s", bot_response)
         return {"response": bot_response}
     except Exception as e:
         logging.error(f"Erro ao invocar a cadeia do chatbot: {e}")
         return {"response": "Desculpe, ocorreu um erro ao processar sua solicitação."}
+
+# Versão em streaming: envia o texto ao cliente conforme o LLM o gera
+@app.post("/api/chat/stream")
+async def stream_chat_message(request: ChatRequest) -> StreamingResponse:
+    logging.info(f"Requisição de chat (streaming) recebida ({len(request.user_message)} caracteres).")
+    logging.debug("Mensagem do usuário: %s", request.user_message)
+
+    if not ready:
+        raise HTTPException(status_code=503, detail="O chatbot está aquecendo, tente novamente em instantes.")
+
+    async def generate_response():
+        if not chain:
+            logging.error("A cadeia RAG não foi inicializada.")
+            yield "Desculpe, o sistema de conhecimento está indisponível no momento."
+            return
+
+        chunks = []
+        try:
+            cached_response, query_vector = await lookup_cached_response(request.user_message)
+            if cached_response is not None:
+                logging.info(f"Resposta obtida do cache para o chat ({len(cached_response)} caracteres).")
+                yield cached_response
+                return
+
+            async for chunk in chain.astream(request.user_message):
+                chunks.append(chunk)
+                yield chunk
+            bot_response = "".join(chunks)
+            response_cache.put(request.user_message, query_vector, bot_response)
+            logging.info(f"Resposta gerada pelo bot para o chat ({len(bot_response)} caracteres).")
+            logging.debug("Resposta do bot: %s", bot_response)
+        except Exception as e:
+            logging.error(f"Erro ao invocar a cadeia do chatbot: {e}")
+            if chunks:
+                # Parte da resposta já foi enviada: interrompe o stream em vez de
+                # emendar o pedido de desculpas no texto. O cliente percebe a
+                # conexão encerrada com erro e exibe o aviso em uma mensagem separada.
+                raise
+            yield "Desculpe, ocorreu um erro ao processar sua solicitação."
+
+    # X-Accel-Buffering desativa o buffer do Nginx, que segura a resposta até o fim
+    return StreamingResponse(
+        generate_response(),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Accel-Buffering": "no"},
+    )
 # --- Fim do novo endpoint ---
 
 
 # Evento de startup da aplicação FastAPI
 @app.on_event("startup")
 async def startup_event():
-    logging.info("Aplicação iniciando. Carregando documentos para RAG...")
-    # O diretório 'data' deve conter os arquivos PDF
-    load_and_process_documents("data")
-    logging.info("Processo de carregamento de documentos concluído.")
+    logging.info("Aplicação iniciando. Carregando documentos para RAG em segundo plano...")
+    # O diretório 'data' deve conter os arquivos PDF.
+    # O carregamento roda em uma thread para não bloquear o event loop: o servidor
+    # já aceita requisições enquanto isso, e o /api/chat responde 503 até terminar.
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=THREADPOOL_SIZE))
+    loop.run_in_executor(None, load_and_process_documents, "data")
 
+# Evento de encerramento da aplicação FastAPI
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_http_clients()
+    log_listener.stop()
@@ -0,0 +1,77 @@
+# Fábrica dos modelos de IA usados pelo chatbot (embeddings e LLM).
+# Toda a configuração da OpenAI fica neste módulo, para que ajustes de modelo,
+# lotes ou conexões valham igualmente para qualquer parte da aplicação.
+import os
+import logging
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+
+# Carrega as variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Carrega e verifica a OPENAI_API_KEY
+openai_api_key_env = os.getenv("OPENAI_API_KEY")
+if not openai_api_key_env:
+    logging.error("OPENAI_API_KEY não encontrada nas variáveis de ambiente.")
+    raise ValueError("OPENAI_API_KEY não encontrada. Por favor, configure-a no arquivo .env.")
+
+# --- Modelos da OpenAI ---
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Quantidade de chunks enviada em cada requisição de embeddings
+EMBEDDING_BATCH_SIZE = 100
+# Novas tentativas (com espera exponencial) em erros temporários ou de limite
+# de taxa da API de embeddings
+EMBEDDING_MAX_RETRIES = 6
+# Você pode especificar outros modelos como "gpt-4" se tiver acesso
+LLM_MODEL = "gpt-3.5-turbo"
+# --- Fim dos modelos ---
+
+# --- Clientes HTTP compartilhados pelas chamadas à OpenAI ---
+# Mantêm as conexões (e sessões TLS) abertas entre as requisições do chat,
+# evitando um novo handshake a cada embedding ou chamada ao LLM.
+# O cliente assíncrono atende as chamadas feitas pelos endpoints (ainvoke/astream).
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+HTTP_TIMEOUT = 30
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """Cria um cliente HTTP assíncrono com a configuração padrão de conexões."""
+    return httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+
+http_client = httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+http_async_client = create_async_http_client()
+# --- Fim dos clientes HTTP ---
+
+
+def get_embeddings(http_async_client: httpx.AsyncClient = http_async_client) -> OpenAIEmbeddings:
+    """
+    Cria o modelo de embeddings usado na indexação e nas perguntas.
+    Um cliente assíncrono próprio deve ser passado quando as chamadas rodarem
+    fora do event loop da aplicação (as conexões ficam presas ao loop que as abriu).
+    """
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        chunk_size=EMBEDDING_BATCH_SIZE,
+        max_retries=EMBEDDING_MAX_RETRIES,
+        openai_api_key=openai_api_key_env,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def get_llm() -> ChatOpenAI:
+    """Cria o modelo de chat que gera as respostas da cadeia RAG."""
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        openai_api_key=openai_api_key_env,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+async def close_http_clients():
+    """Fecha as conexões abertas com a OpenAI."""
+    http_client.close()
+    await http_async_client.aclose()
@@ -24,6 +24,8 @@ const App = () => {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  // Indica que a resposta do bot já começou a chegar (esconde o indicador de digitação)
+  const [isStreaming, setIsStreaming] = useState(false);
   // NOVO: Estado para armazenar o arquivo selecionado
   const [selectedFile, setSelectedFile] = useState(null);
   
@@ -46,9 +48,12 @@ const App = () => {
     setInput('');
     setIsLoading(true);
 
+    // Texto da resposta do bot recebido até o momento
+    let botText = '';
     try {
-      // Faz a requisição POST para o endpoint '/api/chat'
-      const response = await fetch(`${API_BASE_URL}/chat`, {
+      // Faz a requisição POST para o endpoint '/api/chat/stream', que devolve
+      // o texto da resposta aos poucos, conforme o modelo o gera
+      const response = await fetch(`${API_BASE_URL}/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -62,17 +67,36 @@ const App = () => {
         throw new Error(`Erro de HTTP: ${response.status}`);
       }
 
-      // Converte a resposta para JSON e adiciona a mensagem do bot à lista
-      const data = await response.json();
-      const botMessage = { sender: 'bot', text: data.response };
-      setMessages(prevMessages => [...prevMessages, botMessage]);
+      // Lê a resposta em partes; a mensagem do bot é criada no primeiro trecho
+      // recebido e atualizada a cada novo trecho
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const botMessageId = Date.now();
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        botText += decoder.decode(value, { stream: true });
+        const botMessage = { id: botMessageId, sender: 'bot', text: botText };
+        setMessages(prevMessages =>
+          prevMessages.some(msg => msg.id === botMessageId)
+            ? prevMessages.map(msg => (msg.id === botMessageId ? botMessage : msg))
+            : [...prevMessages, botMessage]
+        );
+        setIsStreaming(true);
+      }
 
     } catch (error) {
       console.error('Erro ao enviar mensagem:', error);
-      const errorMessage = { sender: 'bot', text: 'Desculpe, ocorreu um erro ao se conectar com o servidor.' };
+      // Se a resposta já tinha começado, o erro aparece em uma mensagem separada,
+      // deixando claro que o texto acima ficou incompleto
+      const errorText = botText
+        ? 'Desculpe, a resposta acima foi interrompida por um erro. Tente novamente.'
+        : 'Desculpe, ocorreu um erro ao se conectar com o servidor.';
+      const errorMessage = { sender: 'bot', text: errorText };
       setMessages(prevMessages => [...prevMessages, errorMessage]);
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -157,7 +181,7 @@ const App = () => {
                 </div>
               </div>
             ))}
-            {isLoading && (
+            {isLoading && !isStreaming && (
               <div className="flex justify-start">
                 <div className="flex items-start gap-3 p-4 bg-slate-700 text-slate-200 rounded-3xl rounded-bl-none max-w-[80%]">
                   <div className="flex-shrink-0 p-2 bg-slate-600 rounded-full">